@@ -17,7 +17,6 @@ from kubernetes import client as k8s_client
 from kubernetes import config
 import time
 import logging
-import re
 
 from .. import dsl
 
@@ -126,7 +125,7 @@ class K8sHelper(object):
     """From _make_kubernetes_name
       sanitize_k8s_name cleans and converts the names in the workflow.
     """
-    return re.sub('-+', '-', re.sub('[^-0-9a-z]+', '-', name.lower())).lstrip('-').rstrip('-')
+    return dsl._pipeline_param.sanitize_k8s_name(name)
 
   @staticmethod
   def convert_k8s_obj_to_json(k8s_obj):
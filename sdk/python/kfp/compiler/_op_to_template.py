@@ -121,7 +121,7 @@ def _process_base_ops(op: BaseOp):
 def _parameters_to_json(params: List[dsl.PipelineParam]):
     """Converts a list of PipelineParam into an argo `parameter` JSON obj."""
     _to_json = (lambda param: dict(name=param.full_name, value=param.value)
-                if param.value else dict(name=param.full_name))
+                if param.value is not None else dict(name=param.full_name))
     params = [_to_json(param) for param in params]
     # Sort to make the results deterministic.
     params.sort(key=lambda x: x['name'])
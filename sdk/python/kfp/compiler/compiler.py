@@ -14,8 +14,12 @@
 
 
 from collections import defaultdict
+import functools
 import inspect
+import itertools
+from operator import itemgetter
 import re
+import sys
 import tarfile
 import zipfile
 import yaml
@@ -28,6 +32,16 @@ from ._default_transformers import add_pod_env
 from ..dsl._metadata import TypeMeta, _extract_pipeline_metadata
 from ..dsl._ops_group import OpsGroup
 
+# Use the libyaml based emitter when PyYAML is built with it. The representer is the
+# same as the default one, so the parsed workflow is unchanged, but the yaml text can
+# differ in where long scalars are wrapped.
+class _WorkflowDumper(getattr(yaml, 'CDumper', yaml.Dumper)):
+  """Yaml dumper for workflows, which never emits anchors/aliases for shared objects."""
+
+  def ignore_aliases(self, data):
+    return True
+
+
 class Compiler(object):
   """DSL Compiler.
 
@@ -44,6 +58,10 @@ class Compiler(object):
   ```
   """
 
+  def __init__(self):
+    # Cache of (op_name, name) -> full param name, reset for every compilation.
+    self._full_name_cache = {}
+
   def _pipelineparam_full_name(self, param):
     """_pipelineparam_full_name converts the names of pipeline parameters
       to unique names in the argo yaml
@@ -51,222 +69,195 @@ class Compiler(object):
     Args:
       param(PipelineParam): pipeline parameter
       """
-    if param.op_name:
-      return param.op_name + '-' + param.name
-    return param.name
-
-  def _get_groups_for_ops(self, root_group):
-    """Helper function to get belonging groups for each op.
-
-    Each pipeline has a root group. Each group has a list of operators (leaf) and groups.
-    This function traverse the tree and get all ancestor groups for all operators.
-
-    Returns:
-      A dict. Key is the operator's name. Value is a list of ancestor groups including the
-              op itself. The list of a given operator is sorted in a way that the farthest
-              group is the first and operator itself is the last.
-    """
-    def _get_op_groups_helper(current_groups, ops_to_groups):
-      root_group = current_groups[-1]
-      for g in root_group.groups:
-        # Add recursive opsgroup in the ops_to_groups
-        # such that the i/o dependency can be propagated to the ancester opsgroups
-        if g.recursive_ref:
-          ops_to_groups[g.name] = [x.name for x in current_groups] + [g.name]
-          continue
-        current_groups.append(g)
-        _get_op_groups_helper(current_groups, ops_to_groups)
-        del current_groups[-1]
-      for op in root_group.ops:
-        ops_to_groups[op.name] = [x.name for x in current_groups] + [op.name]
+    key = (param.op_name, param.name)
+    full_name = self._full_name_cache.get(key)
+    if full_name is None:
+      full_name = sys.intern(param.op_name + '-' + param.name if param.op_name else param.name)
+      self._full_name_cache[key] = full_name
+    return full_name
 
-    ops_to_groups = {}
-    current_groups = [root_group]
-    _get_op_groups_helper(current_groups, ops_to_groups)
-    return ops_to_groups
-
-  #TODO: combine with the _get_groups_for_ops
-  def _get_groups_for_opsgroups(self, root_group):
-    """Helper function to get belonging groups for each opsgroup.
+  def _build_group_indices(self, root_group):
+    """Helper function to index the group tree of a pipeline in a single traversal.
 
     Each pipeline has a root group. Each group has a list of operators (leaf) and groups.
-    This function traverse the tree and get all ancestor groups for all opsgroups.
+    This function traverses the tree once and collects everything the compiler needs to
+    know about the group hierarchy.
 
     Returns:
-      A dict. Key is the opsgroup's name. Value is a list of ancestor groups including the
-              opsgroup itself. The list of a given opsgroup is sorted in a way that the farthest
-              group is the first and opsgroup itself is the last.
+      A tuple (opsgroups, op_groups, opsgroups_groups, condition_params).
+      opsgroups: a dict of opsgroup name -> opsgroup for all groups (not including ops),
+                 skipping the recursive opsgroups.
+      op_groups: a dict of op name -> tuple of ancestor group names including the op itself.
+                 The tuple is sorted in a way that the farthest group is the first and the op
+                 itself is the last. Recursive opsgroups are included such that the i/o
+                 dependency can be propagated to the ancestor opsgroups.
+      opsgroups_groups: a dict of opsgroup name -> tuple of ancestor group names including
+                        the opsgroup itself, sorted the same way as op_groups.
+      condition_params: a dict of op/recursive opsgroup name -> tuple of distinct pipeline
+                        params referenced in the conditions of its ancestor groups.
     """
-    def _get_opsgroup_groups_helper(current_groups, opsgroups_to_groups):
-      root_group = current_groups[-1]
-      for g in root_group.groups:
-        # Add recursive opsgroup in the ops_to_groups
-        # such that the i/o dependency can be propagated to the ancester opsgroups
+    opsgroups = {}
+    op_groups = {}
+    opsgroups_groups = {}
+    condition_params = defaultdict(set)
+
+    # group_names is the tuple of ancestor group names including the current group. It is
+    # extended once per group and shared as the prefix of all entries below that group.
+    def _build_group_indices_helper(group, group_names, current_conditions_params):
+      opsgroups[group.name] = group
+      # Only copy the inherited condition params when this group adds its own.
+      if group.type == 'condition':
+        current_conditions_params = list(current_conditions_params)
+        if isinstance(group.condition.operand1, dsl.PipelineParam):
+          current_conditions_params.append(group.condition.operand1)
+        if isinstance(group.condition.operand2, dsl.PipelineParam):
+          current_conditions_params.append(group.condition.operand2)
+      for g in group.groups:
+        # Add recursive opsgroup in the op_groups such that the i/o dependency can be
+        # propagated to the ancester opsgroups, and propagate the pipelineparams in the
+        # condition expression, similar to the ops. No templates need to be generated
+        # for the recursive opsgroups.
         if g.recursive_ref:
+          op_groups[g.name] = group_names + (g.name,)
+          condition_params[g.name].update(current_conditions_params)
           continue
-        opsgroups_to_groups[g.name] = [x.name for x in current_groups] + [g.name]
-        current_groups.append(g)
-        _get_opsgroup_groups_helper(current_groups, opsgroups_to_groups)
-        del current_groups[-1]
-
-    opsgroups_to_groups = {}
-    current_groups = [root_group]
-    _get_opsgroup_groups_helper(current_groups, opsgroups_to_groups)
-    return opsgroups_to_groups
-
-  def _get_groups(self, root_group):
-    """Helper function to get all groups (not including ops) in a pipeline."""
-
-    def _get_groups_helper(group):
-      groups = {group.name: group}
-      for g in group.groups:
-        # Skip the recursive opsgroup because no templates
-        # need to be generated for the recursive opsgroups.
-        if not g.recursive_ref:
-          groups.update(_get_groups_helper(g))
-      return groups
+        g_names = group_names + (g.name,)
+        opsgroups_groups[g.name] = g_names
+        _build_group_indices_helper(g, g_names, current_conditions_params)
+      for op in group.ops:
+        op_groups[op.name] = group_names + (op.name,)
+        condition_params[op.name].update(current_conditions_params)
 
-    return _get_groups_helper(root_group)
+    _build_group_indices_helper(root_group, (root_group.name,), [])
+    # The params are deduplicated by now and only iterated from here on.
+    condition_params = {name: tuple(params) for name, params in condition_params.items()}
+    return opsgroups, op_groups, opsgroups_groups, condition_params
 
-  def _get_uncommon_ancestors(self, op_groups, opsgroup_groups, op1, op2):
+  def _get_uncommon_ancestors(self, ancestor_groups, op1, op2):
     """Helper function to get unique ancestors between two ops.
 
     For example, op1's ancestor groups are [root, G1, G2, G3, op1], op2's ancestor groups are
     [root, G1, G4, op2], then it returns a tuple ([G2, G3, op1], [G4, op2]).
-    """
-    #TODO: extract a function for the following two code module
-    if op1.name in op_groups:
-      op1_groups = op_groups[op1.name]
-    elif op1.name in opsgroup_groups:
-      op1_groups = opsgroup_groups[op1.name]
-    else:
-      raise ValueError(op1.name + ' does not exist.')
 
-    if op2.name in op_groups:
-      op2_groups = op_groups[op2.name]
-    elif op2.name in opsgroup_groups:
-      op2_groups = opsgroup_groups[op2.name]
-    else:
+    Args:
+      ancestor_groups: a dict of op/opsgroup name -> ancestor group names including itself,
+                       covering both the op_groups and the opsgroups_groups entries.
+    """
+    op1_groups = ancestor_groups.get(op1.name)
+    if op1_groups is None:
       raise ValueError(op1.name + ' does not exist.')
-
-    both_groups = [op1_groups, op2_groups]
-    common_groups_len = sum(1 for x in zip(*both_groups) if x==(x[0],)*len(x))
+    op2_groups = ancestor_groups.get(op2.name)
+    if op2_groups is None:
+      raise ValueError(op2.name + ' does not exist.')
+
+    # The ancestor lists are indexed by depth, so they double as a jump table:
+    # the two lists agree exactly up to the lowest common ancestor, and its
+    # depth can be found by bisecting on depth in O(log d) comparisons.
+    # Both lists start with the pipeline root group, so depth 0 always matches.
+    # Names at the same depth are usually the same (interned) string object, for which the
+    # string comparison returns without comparing characters.
+    low, high = 1, min(len(op1_groups), len(op2_groups))
+    while low < high:
+      mid = (low + high) // 2
+      if op1_groups[mid] == op2_groups[mid]:
+        low = mid + 1
+      else:
+        high = mid
+    common_groups_len = low
     group1 = op1_groups[common_groups_len:]
     group2 = op2_groups[common_groups_len:]
     return (group1, group2)
 
-  def _get_condition_params_for_ops(self, root_group):
-    """Get parameters referenced in conditions of ops."""
-
-    conditions = defaultdict(set)
-
-    def _get_condition_params_for_ops_helper(group, current_conditions_params):
-      new_current_conditions_params = current_conditions_params
-      if group.type == 'condition':
-        new_current_conditions_params = list(current_conditions_params)
-        if isinstance(group.condition.operand1, dsl.PipelineParam):
-          new_current_conditions_params.append(group.condition.operand1)
-        if isinstance(group.condition.operand2, dsl.PipelineParam):
-          new_current_conditions_params.append(group.condition.operand2)
-      for op in group.ops:
-        for param in new_current_conditions_params:
-          conditions[op.name].add(param)
-      for g in group.groups:
-        # If the subgroup is a recursive opsgroup, propagate the pipelineparams
-        # in the condition expression, similar to the ops.
-        if g.recursive_ref:
-          for param in new_current_conditions_params:
-            conditions[g.name].add(param)
-        else:
-          _get_condition_params_for_ops_helper(g, new_current_conditions_params)
-    _get_condition_params_for_ops_helper(root_group, [])
-    return conditions
-
-  def _get_inputs_outputs(self, pipeline, root_group, op_groups, opsgroup_groups, condition_params):
+  def _get_inputs_outputs(self, pipeline, root_group, ancestor_groups, condition_params, op_params):
     """Get inputs and outputs of each group and op.
 
+    op_params is a dict of op name -> the op's inputs followed by the params used in the
+    conditions for that op.
+
     Returns:
       A tuple (inputs, outputs).
-      inputs and outputs are dicts with key being the group/op names and values being list of
-      tuples (param_name, producing_op_name). producing_op_name is the name of the op that
+      inputs and outputs are dicts with key being the group/op names and values being dicts
+      of param_name -> producing_op_name. producing_op_name is the name of the op that
       produces the param. If the param is a pipeline param (no producer op), then
       producing_op_name is None.
     """
-    inputs = defaultdict(set)
-    outputs = defaultdict(set)
-
-    for op in pipeline.ops.values():
+    # Flatten all (op/recursive opsgroup, param) edges up front so that the immediate
+    # value check, the full param name and the producing op are resolved once per edge.
+    # Each edge is a tuple (node, full_param_name, producing_op, is_condition_param).
+    # The loops below run once per param reference, so bind the hot lookups locally.
+    ops = pipeline.ops
+    full_name_of = self._pipelineparam_full_name
+    edges = []
+    add_edge = edges.append
+    for op in ops.values():
       # op's inputs and all params used in conditions for that op are both considered.
-      for param in op.inputs + list(condition_params[op.name]):
+      for param in op_params[op.name]:
         # if the value is already provided (immediate value), then no need to expose
         # it as input for its parent groups.
-        if param.value:
+        if param.value is not None:
           continue
-        full_name = self._pipelineparam_full_name(param)
         if param.op_name:
-          upstream_op = pipeline.ops[param.op_name]
-          upstream_groups, downstream_groups = self._get_uncommon_ancestors(
-              op_groups, opsgroup_groups, upstream_op, op)
-          for i, g in enumerate(downstream_groups):
-            if i == 0:
-              # If it is the first uncommon downstream group, then the input comes from
-              # the first uncommon upstream group.
-              inputs[g].add((full_name, upstream_groups[0]))
-            else:
-              # If not the first downstream group, then the input is passed down from
-              # its ancestor groups so the upstream group is None.
-              inputs[g].add((full_name, None))
-          for i, g in enumerate(upstream_groups):
-            if i == len(upstream_groups) - 1:
-              # If last upstream group, it is an operator and output comes from container.
-              outputs[g].add((full_name, None))
-            else:
-              # If not last upstream group, output value comes from one of its child.
-              outputs[g].add((full_name, upstream_groups[i+1]))
-        else:
-          if not op.is_exit_handler:
-            for g in op_groups[op.name]:
-              inputs[g].add((full_name, None))
+          add_edge((op, full_name_of(param), ops[param.op_name], False))
+        elif not op.is_exit_handler:
+          add_edge((op, full_name_of(param), None, False))
+
     # Generate the input/output for recursive opsgroups
     # It propagates the recursive opsgroups IO to their ancester opsgroups
-    def _get_inputs_outputs_recursive_opsgroup(group):
-      #TODO: refactor the following codes with the above
+    def _get_edges_recursive_opsgroup(group):
       if group.recursive_ref:
         params = [(param, False) for param in group.inputs]
-        params.extend([(param, True) for param in list(condition_params[group.name])])
+        params.extend((param, True) for param in condition_params.get(group.name, ()))
         for param, is_condition_param in params:
-          if param.value:
+          if param.value is not None:
             continue
-          full_name = self._pipelineparam_full_name(param)
           if param.op_name:
-            upstream_op = pipeline.ops[param.op_name]
-            upstream_groups, downstream_groups = self._get_uncommon_ancestors(
-              op_groups, opsgroup_groups, upstream_op, group)
-            for i, g in enumerate(downstream_groups):
-              if i == 0:
-                inputs[g].add((full_name, upstream_groups[0]))
-              # There is no need to pass the condition param as argument to the downstream ops.
-              #TODO: this might also apply to ops. add a TODO here and think about it.
-              elif i == len(downstream_groups) - 1 and is_condition_param:
-                continue
-              else:
-                inputs[g].add((full_name, None))
-            for i, g in enumerate(upstream_groups):
-              if i == len(upstream_groups) - 1:
-                outputs[g].add((full_name, None))
-              else:
-                outputs[g].add((full_name, upstream_groups[i+1]))
+            add_edge((group, full_name_of(param), ops[param.op_name], is_condition_param))
           elif not is_condition_param:
-            for g in op_groups[group.name]:
-              inputs[g].add((full_name, None))
+            add_edge((group, full_name_of(param), None, False))
       for subgroup in group.groups:
-        _get_inputs_outputs_recursive_opsgroup(subgroup)
-    _get_inputs_outputs_recursive_opsgroup(root_group)
+        _get_edges_recursive_opsgroup(subgroup)
+    _get_edges_recursive_opsgroup(root_group)
+
+    # A param always reaches a given group from the same producer, so keying by the param
+    # name deduplicates the entries without hashing (param_name, producer) tuples.
+    inputs = defaultdict(dict)
+    outputs = defaultdict(dict)
+    uncommon_ancestors = self._get_uncommon_ancestors
+    for node, full_name, upstream_op, is_condition_param in edges:
+      if upstream_op is None:
+        for g in ancestor_groups[node.name]:
+          inputs[g][full_name] = None
+        continue
+      upstream_groups, downstream_groups = uncommon_ancestors(
+          ancestor_groups, upstream_op, node)
+      for i, g in enumerate(downstream_groups):
+        if i == 0:
+          # If it is the first uncommon downstream group, then the input comes from
+          # the first uncommon upstream group.
+          inputs[g][full_name] = upstream_groups[0]
+        # There is no need to pass the condition param of a recursive opsgroup as argument
+        # to the downstream ops.
+        #TODO: this might also apply to ops. add a TODO here and think about it.
+        elif i == len(downstream_groups) - 1 and is_condition_param:
+          continue
+        else:
+          # If not the first downstream group, then the input is passed down from
+          # its ancestor groups so the upstream group is None.
+          inputs[g][full_name] = None
+      for i, g in enumerate(upstream_groups):
+        if i == len(upstream_groups) - 1:
+          # If last upstream group, it is an operator and output comes from container.
+          outputs[g][full_name] = None
+        else:
+          # If not last upstream group, output value comes from one of its child.
+          outputs[g][full_name] = upstream_groups[i+1]
     return inputs, outputs
 
-  def _get_dependencies(self, pipeline, root_group, op_groups, opsgroups_groups, opsgroups, condition_params):
+  def _get_dependencies(self, pipeline, root_group, ancestor_groups, opsgroups, condition_params, op_params):
     """Get dependent groups and ops for all ops and groups.
 
+    op_params is the same dict of op name -> params as for _get_inputs_outputs.
+
     Returns:
       A dict. Key is group/op name, value is a list of dependent groups/ops.
       The dependencies are calculated in the following way: if op2 depends on op1,
@@ -274,54 +265,52 @@ class Compiler(object):
       then G3 is dependent on G2. Basically dependency only exists in the first uncommon
       ancesters in their ancesters chain. Only sibling groups/ops can have dependencies.
     """
-    dependencies = defaultdict(set)
-    for op in pipeline.ops.values():
-      upstream_op_names = set()
-      for param in op.inputs + list(condition_params[op.name]):
+    # Flatten all (op/opsgroup, upstream op/opsgroup) edges up front.
+    # The upstream could be either a BaseOp or an opsgroup. Ops take precedence over
+    # opsgroups with the same name.
+    ops = pipeline.ops
+    upstream_nodes = {**opsgroups, **ops}
+    edges = []
+    for op in ops.values():
+      upstream_op_names = set(op.dependent_names)
+      for param in op_params[op.name]:
         if param.op_name:
           upstream_op_names.add(param.op_name)
-      upstream_op_names |= set(op.dependent_names)
 
       for op_name in upstream_op_names:
-        # the dependent op could be either a BaseOp or an opsgroup
-        if op_name in pipeline.ops:
-          upstream_op = pipeline.ops[op_name]
-        elif op_name in opsgroups:
-          upstream_op = opsgroups[op_name]
-        else:
+        upstream_op = upstream_nodes.get(op_name)
+        if upstream_op is None:
           raise ValueError('compiler cannot find the ' + op_name)
-
-        upstream_groups, downstream_groups = self._get_uncommon_ancestors(
-            op_groups, opsgroups_groups, upstream_op, op)
-        dependencies[downstream_groups[0]].add(upstream_groups[0])
+        edges.append((op, upstream_op))
 
     # Generate dependencies based on the recursive opsgroups
     #TODO: refactor the following codes with the above
-    def _get_dependency_opsgroup(group, dependencies):
+    def _get_edges_opsgroup(group):
       upstream_op_names = set()
       if group.recursive_ref:
-        for param in group.inputs + list(condition_params[group.name]):
+        for param in itertools.chain(group.inputs, condition_params.get(group.name, ())):
           if param.op_name:
             upstream_op_names.add(param.op_name)
       else:
         upstream_op_names = set([dependency.name for dependency in group.dependencies])
 
       for op_name in upstream_op_names:
-        if op_name in pipeline.ops:
-          upstream_op = pipeline.ops[op_name]
-        elif op_name in opsgroups_groups:
-          upstream_op = opsgroups_groups[op_name]
-        else:
+        upstream_op = upstream_nodes.get(op_name)
+        if upstream_op is None:
           raise ValueError('compiler cannot find the ' + op_name)
-        upstream_groups, downstream_groups = self._get_uncommon_ancestors(
-            op_groups, opsgroups_groups, upstream_op, group)
-        dependencies[downstream_groups[0]].add(upstream_groups[0])
+        edges.append((group, upstream_op))
 
       for subgroup in group.groups:
-        _get_dependency_opsgroup(subgroup, dependencies)
+        _get_edges_opsgroup(subgroup)
 
-    _get_dependency_opsgroup(root_group, dependencies)
+    _get_edges_opsgroup(root_group)
 
+    dependencies = defaultdict(set)
+    uncommon_ancestors = self._get_uncommon_ancestors
+    for node, upstream_op in edges:
+      upstream_groups, downstream_groups = uncommon_ancestors(
+          ancestor_groups, upstream_op, node)
+      dependencies[downstream_groups[0]].add(upstream_groups[0])
     return dependencies
 
   def _resolve_value_or_reference(self, value_or_reference, potential_references):
@@ -333,17 +322,13 @@ class Compiler(object):
       """
     if isinstance(value_or_reference, dsl.PipelineParam):
       parameter_name = self._pipelineparam_full_name(value_or_reference)
-      task_names = [task_name for param_name, task_name in potential_references if param_name == parameter_name]
-      if task_names:
-        task_name = task_names[0]
-        # When the task_name is None, the parameter comes directly from ancient ancesters
-        # instead of parents. Thus, it is resolved as the input parameter in the current group.
-        if task_name is None:
-          return '{{inputs.parameters.%s}}' % parameter_name
-        else:
-          return '{{tasks.%s.outputs.parameters.%s}}' % (task_name, parameter_name)
-      else:
+      task_name = potential_references.get(parameter_name)
+      # When the task_name is None, the parameter comes directly from ancient ancesters
+      # instead of parents. Thus, it is resolved as the input parameter in the current group.
+      if task_name is None:
         return '{{inputs.parameters.%s}}' % parameter_name
+      else:
+        return '{{tasks.%s.outputs.parameters.%s}}' % (task_name, parameter_name)
     else:
       return str(value_or_reference)
 
@@ -355,28 +340,30 @@ class Compiler(object):
     template = {'name': group.name}
 
     # Generate inputs section.
-    if inputs.get(group.name, None):
-      template_inputs = [{'name': x[0]} for x in inputs[group.name]]
-      template_inputs.sort(key=lambda x: x['name'])
+    group_inputs = inputs.get(group.name)
+    if group_inputs:
+      template_inputs = [{'name': param_name} for param_name in sorted(group_inputs)]
       template['inputs'] = {
         'parameters': template_inputs
       }
     # Generate outputs section.
-    if outputs.get(group.name, None):
+    group_outputs = outputs.get(group.name)
+    if group_outputs:
       template_outputs = []
-      for param_name, dependent_name in outputs[group.name]:
+      for param_name, dependent_name in sorted(group_outputs.items(), key=itemgetter(0)):
         template_outputs.append({
           'name': param_name,
           'valueFrom': {
             'parameter': '{{tasks.%s.outputs.parameters.%s}}' % (dependent_name, param_name)
           }
         })
-      template_outputs.sort(key=lambda x: x['name'])
       template['outputs'] = {'parameters': template_outputs}
 
     # Generate tasks section.
     tasks = []
     for sub_group in group.groups + group.ops:
+      sub_group_inputs = inputs.get(sub_group.name)
+      sub_group_dependencies = dependencies.get(sub_group.name)
       is_recursive_subgroup = (isinstance(sub_group, OpsGroup) and sub_group.recursive_ref)
       # Special handling for recursive subgroup: use the existing opsgroup name
       if is_recursive_subgroup:
@@ -390,62 +377,48 @@ class Compiler(object):
           'template': sub_group.name,
         }
       if isinstance(sub_group, dsl.OpsGroup) and sub_group.type == 'condition':
-        subgroup_inputs = inputs.get(sub_group.name, [])
+        subgroup_inputs = sub_group_inputs or {}
         condition = sub_group.condition
         operand1_value = self._resolve_value_or_reference(condition.operand1, subgroup_inputs)
         operand2_value = self._resolve_value_or_reference(condition.operand2, subgroup_inputs)
         task['when'] = '{} {} {}'.format(operand1_value, condition.operator, operand2_value)
 
       # Generate dependencies section for this task.
-      if dependencies.get(sub_group.name, None):
-        group_dependencies = list(dependencies[sub_group.name])
-        group_dependencies.sort()
-        task['dependencies'] = group_dependencies
+      if sub_group_dependencies:
+        task['dependencies'] = sorted(sub_group_dependencies)
 
       # Generate arguments section for this task.
-      if inputs.get(sub_group.name, None):
+      if sub_group_inputs:
+        # Special handling for recursive subgroup: argument name comes from the existing opsgroup
+        if is_recursive_subgroup:
+          input_indices = {}
+          for index, input in enumerate(sub_group.inputs):
+            input_indices.setdefault(self._pipelineparam_full_name(input), index)
         arguments = []
-        for param_name, dependent_name in inputs[sub_group.name]:
+        for param_name, dependent_name in sub_group_inputs.items():
+          if is_recursive_subgroup:
+            # A name that is not an input of the subgroup falls back to the last input.
+            index = input_indices.get(param_name, len(sub_group.inputs) - 1)
+            referenced_input = sub_group.recursive_ref.inputs[index]
+            argument_name = self._pipelineparam_full_name(referenced_input)
+          else:
+            argument_name = param_name
           if dependent_name:
             # The value comes from an upstream sibling.
-            # Special handling for recursive subgroup: argument name comes from the existing opsgroup
-            if is_recursive_subgroup:
-              for index, input in enumerate(sub_group.inputs):
-                if param_name == self._pipelineparam_full_name(input):
-                  break
-              referenced_input = sub_group.recursive_ref.inputs[index]
-              full_name = self._pipelineparam_full_name(referenced_input)
-              arguments.append({
-                  'name': full_name,
-                  'value': '{{tasks.%s.outputs.parameters.%s}}' % (dependent_name, param_name)
-              })
-            else:
-              arguments.append({
-                'name': param_name,
-                'value': '{{tasks.%s.outputs.parameters.%s}}' % (dependent_name, param_name)
-              })
+            arguments.append({
+              'name': argument_name,
+              'value': '{{tasks.%s.outputs.parameters.%s}}' % (dependent_name, param_name)
+            })
           else:
             # The value comes from its parent.
-            # Special handling for recursive subgroup: argument name comes from the existing opsgroup
-            if is_recursive_subgroup:
-              for index, input in enumerate(sub_group.inputs):
-                if param_name == self._pipelineparam_full_name(input):
-                  break
-              referenced_input = sub_group.recursive_ref.inputs[index]
-              full_name = self._pipelineparam_full_name(referenced_input)
-              arguments.append({
-                  'name': full_name,
-                  'value': '{{inputs.parameters.%s}}' % param_name
-              })
-            else:
-              arguments.append({
-                'name': param_name,
-                'value': '{{inputs.parameters.%s}}' % param_name
-              })
-        arguments.sort(key=lambda x: x['name'])
+            arguments.append({
+              'name': argument_name,
+              'value': '{{inputs.parameters.%s}}' % param_name
+            })
+        arguments.sort(key=itemgetter('name'))
         task['arguments'] = {'parameters': arguments}
       tasks.append(task)
-    tasks.sort(key=lambda x: x['name'])
+    tasks.sort(key=itemgetter('name'))
     template['dag'] = {'tasks': tasks}
     return template
 
@@ -469,21 +442,25 @@ class Compiler(object):
         transformer(op)
 
     # Generate core data structures to prepare for argo yaml generation
-    #   op_groups: op name -> list of ancestor groups including the current op
+    #   op_groups: op name -> tuple of ancestor group names including the current op
+    #   opsgroups_groups: opsgroup name -> tuple of ancestor group names including the opsgroup
+    #   ancestor_groups: op_groups and opsgroups_groups merged, ops taking precedence
     #   opsgroups: a dictionary of ospgroup.name -> opsgroup
-    #   inputs, outputs: group/op names -> list of tuples (full_param_name, producing_op_name)
-    #   condition_params: recursive_group/op names -> list of pipelineparam
+    #   inputs, outputs: group/op names -> dict of full_param_name -> producing_op_name
+    #   condition_params: recursive_group/op names -> tuple of pipelineparam
+    #   op_params: op names -> tuple of the op's inputs and condition params
     #   dependencies: group/op name -> list of dependent groups/ops.
     # Special Handling for the recursive opsgroup
     #   op_groups also contains the recursive opsgroups
-    #   condition_params from _get_condition_params_for_ops also contains the recursive opsgroups
-    #   groups does not include the recursive opsgroups
-    opsgroups = self._get_groups(new_root_group)
-    op_groups = self._get_groups_for_ops(new_root_group)
-    opsgroups_groups = self._get_groups_for_opsgroups(new_root_group)
-    condition_params = self._get_condition_params_for_ops(new_root_group)
-    inputs, outputs = self._get_inputs_outputs(pipeline, new_root_group, op_groups, opsgroups_groups, condition_params)
-    dependencies = self._get_dependencies(pipeline, new_root_group, op_groups, opsgroups_groups, opsgroups, condition_params)
+    #   condition_params also contains the recursive opsgroups
+    #   opsgroups does not include the recursive opsgroups
+    opsgroups, op_groups, opsgroups_groups, condition_params = self._build_group_indices(new_root_group)
+    ancestor_groups = {**opsgroups_groups, **op_groups}
+    # Both the inputs/outputs and the dependencies walk each op's inputs and condition params.
+    op_params = {op.name: tuple(itertools.chain(op.inputs, condition_params.get(op.name, ())))
+                 for op in pipeline.ops.values()}
+    inputs, outputs = self._get_inputs_outputs(pipeline, new_root_group, ancestor_groups, condition_params, op_params)
+    dependencies = self._get_dependencies(pipeline, new_root_group, ancestor_groups, opsgroups, condition_params, op_params)
 
     templates = []
     for opsgroup in opsgroups.keys():
@@ -568,7 +545,13 @@ class Compiler(object):
     Note this is a temporary workaround until argo supports local exit handler.
     """
 
-    def _validate_exit_handler_helper(group, exiting_op_names, handler_exists):
+    # Walk the groups depth first with an explicit stack. The handler flag is shared by the
+    # whole walk so that sibling exit handlers are detected as well as nested ones.
+    handler_exists = False
+    exiting_op_names = []
+    groups = [pipeline.groups[0]]
+    while groups:
+      group = groups.pop()
       if group.type == 'exit_handler':
         if handler_exists or len(exiting_op_names) > 1:
           raise ValueError('Only one global exit_handler is allowed and all ops need to be included.')
@@ -577,14 +560,13 @@ class Compiler(object):
       if group.ops:
         exiting_op_names.extend([x.name for x in group.ops])
 
-      for g in group.groups:
-        _validate_exit_handler_helper(g, exiting_op_names, handler_exists)
-
-    return _validate_exit_handler_helper(pipeline.groups[0], [], False)
+      # Push the subgroups in reverse so that they are visited in their original order.
+      groups.extend(reversed(group.groups))
 
   def _compile(self, pipeline_func):
     """Compile the given pipeline function into workflow."""
 
+    self._full_name_cache = {}
     argspec = inspect.getfullargspec(pipeline_func)
 
     # Create the arg list with no default values and call pipeline function.
@@ -615,6 +597,13 @@ class Compiler(object):
         arg.value = default.value if isinstance(default, dsl.PipelineParam) else default
 
     # Sanitize operator names and param names
+    # The same op names show up in many params, so only sanitize each distinct name once.
+    # The results are interned so that the names used as dict keys and compared across the
+    # group/op indices below are shared string objects.
+    @functools.lru_cache(maxsize=None)
+    def sanitize(name):
+      return sys.intern(K8sHelper.sanitize_k8s_name(name))
+
     sanitized_ops = {}
     # pipeline level artifact location
     artifact_location = p.conf.artifact_location
@@ -625,26 +614,26 @@ class Compiler(object):
       if artifact_location and not op.artifact_location:
         op.artifact_location = artifact_location
 
-      sanitized_name = K8sHelper.sanitize_k8s_name(op.name)
+      sanitized_name = sanitize(op.name)
       op.name = sanitized_name
       for param in op.outputs.values():
-        param.name = K8sHelper.sanitize_k8s_name(param.name)
+        param.name = sanitize(param.name)
         if param.op_name:
-          param.op_name = K8sHelper.sanitize_k8s_name(param.op_name)
+          param.op_name = sanitize(param.op_name)
       if op.output is not None:
-        op.output.name = K8sHelper.sanitize_k8s_name(op.output.name)
-        op.output.op_name = K8sHelper.sanitize_k8s_name(op.output.op_name)
+        op.output.name = sanitize(op.output.name)
+        op.output.op_name = sanitize(op.output.op_name)
       if op.dependent_names:
-        op.dependent_names = [K8sHelper.sanitize_k8s_name(name) for name in op.dependent_names]
+        op.dependent_names = [sanitize(name) for name in op.dependent_names]
       if isinstance(op, dsl.ContainerOp) and op.file_outputs is not None:
         sanitized_file_outputs = {}
         for key in op.file_outputs.keys():
-          sanitized_file_outputs[K8sHelper.sanitize_k8s_name(key)] = op.file_outputs[key]
+          sanitized_file_outputs[sanitize(key)] = op.file_outputs[key]
         op.file_outputs = sanitized_file_outputs
       elif isinstance(op, dsl.ResourceOp) and op.attribute_outputs is not None:
         sanitized_attribute_outputs = {}
         for key in op.attribute_outputs.keys():
-          sanitized_attribute_outputs[K8sHelper.sanitize_k8s_name(key)] = \
+          sanitized_attribute_outputs[sanitize(key)] = \
             op.attribute_outputs[key]
         op.attribute_outputs = sanitized_attribute_outputs
       sanitized_ops[sanitized_name] = op
@@ -668,23 +657,29 @@ class Compiler(object):
     try:
       kfp.TYPE_CHECK = type_check
       workflow = self._compile(pipeline_func)
-      yaml.Dumper.ignore_aliases = lambda *args : True
-      yaml_text = yaml.dump(workflow, default_flow_style=False)
 
       if package_path.endswith('.tar.gz') or package_path.endswith('.tgz'):
-        from contextlib import closing
         from io import BytesIO
+        # The tar header needs the member size up front, so the encoded yaml is buffered
+        # once and the buffer itself is handed to the tar file.
+        yaml_file = BytesIO()
+        yaml.dump(workflow, yaml_file, Dumper=_WorkflowDumper, default_flow_style=False,
+                  encoding='utf-8')
+        tarinfo = tarfile.TarInfo('pipeline.yaml')
+        tarinfo.size = yaml_file.tell()
+        yaml_file.seek(0)
         with tarfile.open(package_path, "w:gz") as tar:
-          with closing(BytesIO(yaml_text.encode())) as yaml_file:
-            tarinfo = tarfile.TarInfo('pipeline.yaml')
-            tarinfo.size = len(yaml_file.getvalue())
-            tar.addfile(tarinfo, fileobj=yaml_file)
+          tar.addfile(tarinfo, fileobj=yaml_file)
       elif package_path.endswith('.zip'):
+        yaml_text = yaml.dump(workflow, Dumper=_WorkflowDumper, default_flow_style=False)
         with zipfile.ZipFile(package_path, "w") as zip:
           zipinfo = zipfile.ZipInfo('pipeline.yaml')
           zipinfo.compress_type = zipfile.ZIP_DEFLATED
           zip.writestr(zipinfo, yaml_text)
       elif package_path.endswith('.yaml') or package_path.endswith('.yml'):
+          # Render the whole yaml before touching the output file, so that a failed dump
+          # does not leave it truncated.
+          yaml_text = yaml.dump(workflow, Dumper=_WorkflowDumper, default_flow_style=False)
           with open(package_path, 'w') as yaml_file:
             yaml_file.write(yaml_text)
       else:
@@ -23,13 +23,15 @@ from ._metadata import TypeMeta
 # For now, this identifies a condition with only "==" operator supported.
 ConditionOperator = namedtuple('ConditionOperator', 'operator operand1 operand2')
 PipelineParamTuple = namedtuple('PipelineParamTuple', 'name op value type pattern')
+# Any run of characters outside [0-9a-z], including runs of dashes, becomes a single dash.
+_K8S_NAME_SEPARATORS_RE = re.compile('[^0-9a-z]+')
 
 
 def sanitize_k8s_name(name):
     """From _make_kubernetes_name
       sanitize_k8s_name cleans and converts the names in the workflow.
     """
-    return re.sub('-+', '-', re.sub('[^-0-9a-z]+', '-', name.lower())).lstrip('-').rstrip('-')
+    return _K8S_NAME_SEPARATORS_RE.sub('-', name.lower()).strip('-')
 
 
 def match_serialized_pipelineparam(payload: str):
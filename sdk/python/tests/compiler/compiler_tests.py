@@ -478,6 +478,57 @@ class TestCompiler(unittest.TestCase):
 
     compiler.Compiler()._compile(pipeline)
 
+  def test_falsy_immediate_value(self):
+    """Test that a falsy immediate value is provided on the op instead of as group input."""
+    @dsl.pipeline(name='Pipeline', description='')
+    def pipeline(a):
+      exit_op = dsl.ContainerOp(name='exit', image='image')
+      with dsl.ExitHandler(exit_op):
+        op = dsl.ContainerOp(name='op', image='image', arguments=['echo', a])
+        op.inputs[0].value = ''
+
+    workflow = compiler.Compiler()._compile(pipeline)
+    templates = {template['name']: template for template in workflow['spec']['templates']}
+    self.assertEqual(templates['op']['inputs']['parameters'], [{'name': 'a', 'value': ''}])
+    self.assertNotIn('inputs', templates['exit-handler-1'])
+    self.assertNotIn('arguments', templates['exit-handler-1']['dag']['tasks'][0])
+
+  def test_validate_exit_handler_rejects_sibling_exit_handlers(self):
+    """Test that a second exit handler next to the first one is rejected."""
+    @dsl.pipeline(name='Pipeline', description='')
+    def pipeline():
+      exit_op = dsl.ContainerOp(name='exit', image='image')
+      with dsl.ExitHandler(exit_op):
+        pass
+      with dsl.ExitHandler(exit_op):
+        dsl.ContainerOp(name='op', image='image')
+
+    with self.assertRaises(ValueError):
+      compiler.Compiler()._compile(pipeline)
+
+  def test_get_uncommon_ancestors(self):
+    """Test splitting ancestor lists at the lowest common ancestor."""
+    from collections import namedtuple
+    Node = namedtuple('Node', 'name')
+    ancestor_groups = {
+      'op1': ['root', 'g1', 'g2', 'g3', 'op1'],
+      'op2': ['root', 'g1', 'g4', 'op2'],
+      'op3': ['root', 'op3'],
+      'g1': ['root', 'g1'],
+      'g2': ['root', 'g1', 'g2'],
+    }
+    uncommon = compiler.Compiler()._get_uncommon_ancestors
+    self.assertEqual(uncommon(ancestor_groups, Node('op1'), Node('op2')),
+                     (['g2', 'g3', 'op1'], ['g4', 'op2']))
+    self.assertEqual(uncommon(ancestor_groups, Node('op3'), Node('op1')),
+                     (['op3'], ['g1', 'g2', 'g3', 'op1']))
+    self.assertEqual(uncommon(ancestor_groups, Node('g2'), Node('op2')),
+                     (['g2'], ['g4', 'op2']))
+    self.assertEqual(uncommon(ancestor_groups, Node('g1'), Node('op3')),
+                     (['g1'], ['op3']))
+    with self.assertRaises(ValueError):
+      uncommon(ancestor_groups, Node('op1'), Node('missing'))
+
   def _test_op_to_template_yaml(self, ops, file_base_name):
     test_data_dir = os.path.join(os.path.dirname(__file__), 'testdata')
     target_yaml = os.path.join(test_data_dir, file_base_name + '.yaml')
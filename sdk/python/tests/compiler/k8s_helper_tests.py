@@ -31,4 +31,10 @@ class TestCompiler(unittest.TestCase):
       "number": 3,
       "list": [1,2,3],
       "time": now.isoformat()
-    })
\ No newline at end of file
+    })
+
+  def test_sanitize_k8s_name(self):
+    self.assertEqual(K8sHelper.sanitize_k8s_name('My_Op Name'), 'my-op-name')
+    self.assertEqual(K8sHelper.sanitize_k8s_name('--a__--b  c--'), 'a-b-c')
+    self.assertEqual(K8sHelper.sanitize_k8s_name('op-1'), 'op-1')
+    self.assertEqual(K8sHelper.sanitize_k8s_name('_-_'), '')